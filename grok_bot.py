@@ -0,0 +1,609 @@
+# -*- coding: utf-8 -*-
+# Discord bot implementation, started by bot.py
+# Import required libraries for the Discord bot
+import os                  # For accessing environment variables
+import asyncio            # For running blocking work off the event loop
+import contextlib         # For skipping the typing indicator when not needed
+import multiprocessing    # For choosing how PDF worker processes start
+from concurrent.futures import ProcessPoolExecutor  # For parallel, isolated PDF parsing
+from concurrent.futures.process import BrokenProcessPool  # Raised once a PDF worker dies
+import discord            # Discord API library for bot functionality
+from dotenv import load_dotenv  # To load environment variables from .env
+from pdf_extract import extract_text_from_pdf  # Runs in the PDF worker processes
+from openai import AsyncOpenAI, OpenAIError  # For async Grok API calls
+import httpx              # For the pooled HTTP client behind the Grok API client
+import logging            # For logging errors to console
+import re                 # For regex pattern matching
+import time               # For persisted-message timestamps and cache/stream timing
+import hashlib            # For hashing prompts into response cache keys
+import weakref            # For per-conversation locks that free themselves
+from abc import ABC, abstractmethod  # For the history store interface
+import json               # For serializing messages stored in Redis
+import aiosqlite          # For persisting conversation history across restarts
+try:
+    import redis.asyncio as aioredis  # Optional shared history backend
+except ImportError:
+    aioredis = None
+from cachetools import TTLCache  # For bounding in-memory conversation history
+import tiktoken           # For counting tokens in conversation history
+from collections import OrderedDict, deque  # For history and response caching
+from collections.abc import AsyncGenerator  # For typing streamed responses
+from typing import Literal, Optional  # For typing message routes and cache lookups
+
+# Configure logging for error tracking
+logging.basicConfig(
+    level=logging.ERROR,  # Log only errors for minimal output
+    format='%(asctime)s - %(levelname)s - %(message)s'  # Include timestamp
+)
+logger = logging.getLogger(__name__)  # Create logger instance
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Bot configuration using environment variables
+DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")  # Discord bot token
+GROK_API_KEY = os.getenv("GROK_API_KEY")   # Grok API key for xAI
+
+# Validate environment variables
+if not DISCORD_TOKEN or not GROK_API_KEY:
+    raise ValueError("Missing required environment variables")
+
+# Initialize AsyncOpenAI client for Grok API on one pooled HTTP client, so
+# warm keep-alive connections are reused instead of re-handshaking TLS
+client = AsyncOpenAI(
+    api_key=GROK_API_KEY,  # Use Grok API key
+    base_url="https://api.x.ai/v1",  # xAI API endpoint
+    http_client=httpx.AsyncClient(
+        transport=httpx.AsyncHTTPTransport(
+            retries=2,  # Retry failed connection attempts
+            limits=httpx.Limits(max_keepalive_connections=20, keepalive_expiry=60)
+        ),
+        timeout=60
+    )
+)
+
+# Define constants for bot configuration
+MODEL = "grok-3"            # Grok model for text responses
+MAX_RESPONSE_TOKENS = 400        # Max tokens for Grok responses
+DISCORD_MAX_CHARS = 1800         # Max characters for Discord messages
+PDF_MAX_PAGES = 5                # Max PDF pages to extract text from
+PDF_MAX_CHARS = 3000             # Max characters of PDF text to use
+SIMPLE_WORD_THRESHOLD = max(1, int(os.getenv("SIMPLE_WORDS", "8")))  # Fewer words means a simple question (min 1)
+MAX_HISTORY_TOKENS = 8000        # Max tokens for conversation history
+MAX_HISTORY_MESSAGES = 100       # Max messages for conversation history
+HISTORY_DB = os.getenv("HISTORY_DB", "history.db")  # SQLite file for conversation history
+REDIS_URL = os.getenv("REDIS_URL")  # Redis URL for shared conversation history (optional)
+HISTORY_LOAD_LIMIT = 20          # Max messages loaded from the store per conversation
+HISTORY_IDLE_SECONDS = 600       # Drop idle conversations from memory after this
+HISTORY_CACHE_SIZE = 10000       # Max conversations held in memory
+RESPONSE_CACHE_TTL = 3600        # Seconds a cached Grok response stays valid
+RESPONSE_CACHE_SIZE = 5000       # Max cached Grok responses
+STREAM_EDIT_INTERVAL = 1.0       # Min seconds between edits of a streamed reply
+STREAM_EDIT_MIN_CHARS = 40       # Min new characters before editing a streamed reply
+DUPLICATE_WINDOW = 2.0           # Seconds within which an identical re-sent prompt is ignored
+EMPTY_RESPONSE_REPLY = "[Grok Error] Empty response, please try again."  # Sent instead of an empty reply
+
+# System prompt, byte-identical on every request so the provider's prompt
+# cache can reuse it together with the earlier turns of a conversation.
+# Ask for the Discord limit up front so one call always suffices.
+SYSTEM_PROMPT = {
+    "role": "system",
+    "content": f"Answer concisely, under {DISCORD_MAX_CHARS} chars. Focus on main points."
+}
+# Per-turn directive for simple questions, sent after the prompt so the
+# cached prefix stays the same whatever the question type
+BRIEF_INSTRUCTION = {
+    "role": "system",
+    "content": "Instruction for this turn: provide a very brief, direct answer "
+               "(1-2 sentences, max 200 characters). Use plain language."
+}
+
+# Tokenizer used to measure history size (counted once per message)
+ENC = tiktoken.get_encoding("cl100k_base")
+
+# Set up Discord client with required intents
+intents = discord.Intents.default()  # Use default intents
+intents.messages = True             # Enable message events
+intents.message_content = True      # Enable message content access
+# Never ping anyone from bot replies (also covers the replied-to author)
+bot = discord.Client(intents=intents, allowed_mentions=discord.AllowedMentions.none())
+
+# Mention prefixes for the bot, cached once the bot user is known
+BOT_MENTION = None       # Plain mention form: <@ID>
+BOT_MENTION_NICK = None  # Nickname mention form: <@!ID>
+
+# Utility function: Create the PDF worker pool
+def new_pdf_pool() -> ProcessPoolExecutor:
+    """Return a bounded process pool so concurrent PDF parses run on separate
+    cores without holding this process's GIL. Workers are spawned, not
+    forked, since the bot runs threads."""
+    return ProcessPoolExecutor(
+        max_workers=max(2, (os.cpu_count() or 2) // 2),
+        mp_context=multiprocessing.get_context("spawn")
+    )
+
+# PDF worker pool, replaced if a worker crashes and breaks it
+PDF_POOL = new_pdf_pool()
+
+# Conversation history for one user in one channel
+class HistoryEntry:
+    """Messages in order plus their per-message and running token counts."""
+    __slots__ = ('messages', 'tokens', 'total', 'last_prompt', 'last_prompt_at')
+
+    def __init__(self):
+        self.messages = deque()     # Oldest message on the left
+        self.tokens = deque()       # Token count of each message, same order
+        self.total = 0              # Sum of tokens
+        self.last_prompt = None     # Text of the last prompt answered
+        self.last_prompt_at = 0.0   # Monotonic time that prompt arrived
+
+# Durable conversation log, keyed by (user ID, channel ID)
+class HistoryStore(ABC):
+    """Base class for conversation log backends."""
+
+    async def open(self) -> None:
+        """Connect to the backend and create any schema it needs."""
+
+    @abstractmethod
+    async def load(self, key: tuple, limit: int) -> list:
+        """Return up to limit of the most recent messages for key, oldest first."""
+
+    @abstractmethod
+    async def append(self, key: tuple, messages: tuple) -> None:
+        """Append messages to the log for key, keeping at most MAX_HISTORY_MESSAGES."""
+
+    async def close(self) -> None:
+        """Release the backend connection."""
+
+# SQLite backend for single-instance deployments
+class SQLiteStore(HistoryStore):
+    """Conversation log in a local SQLite file, trimmed to MAX_HISTORY_MESSAGES per key."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = None
+
+    async def open(self) -> None:
+        self.conn = await aiosqlite.connect(self.path)
+        # WAL with relaxed syncing favours write throughput
+        await self.conn.execute("PRAGMA journal_mode=WAL")
+        await self.conn.execute("PRAGMA synchronous=NORMAL")
+        await self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS hist "
+            "(user_id INTEGER, channel_id INTEGER, ts REAL, role TEXT, content TEXT)"
+        )
+        await self.conn.execute("CREATE INDEX IF NOT EXISTS hist_key_ts ON hist (user_id, channel_id, ts DESC)")
+        await self.conn.commit()
+
+    async def load(self, key: tuple, limit: int) -> list:
+        async with self.conn.execute(
+            "SELECT role, content FROM hist WHERE user_id = ? AND channel_id = ? "
+            "ORDER BY ts DESC, rowid DESC LIMIT ?",
+            (*key, limit)
+        ) as cursor:
+            rows = await cursor.fetchall()
+        return [{"role": role, "content": content} for role, content in reversed(rows)]
+
+    async def append(self, key: tuple, messages: tuple) -> None:
+        await self.conn.executemany(
+            "INSERT INTO hist VALUES (?, ?, ?, ?, ?)",
+            [(*key, time.time(), msg["role"], msg["content"]) for msg in messages]
+        )
+        # Trim to the newest messages, as RedisStore does
+        await self.conn.execute(
+            "DELETE FROM hist WHERE user_id = ? AND channel_id = ? AND rowid NOT IN "
+            "(SELECT rowid FROM hist WHERE user_id = ? AND channel_id = ? "
+            "ORDER BY ts DESC, rowid DESC LIMIT ?)",
+            (*key, *key, MAX_HISTORY_MESSAGES)
+        )
+        await self.conn.commit()
+
+    async def close(self) -> None:
+        if self.conn is not None:
+            await self.conn.close()
+
+# Redis backend so several bot instances can share conversations
+class RedisStore(HistoryStore):
+    """Conversation log in Redis lists, trimmed to MAX_HISTORY_MESSAGES per key."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.redis = None
+
+    @staticmethod
+    def _name(key: tuple) -> str:
+        return f"hist:{key[0]}:{key[1]}"
+
+    async def open(self) -> None:
+        if aioredis is None:
+            raise ValueError("REDIS_URL is set but the redis package is not installed")
+        self.redis = aioredis.from_url(self.url, decode_responses=True)
+
+    async def load(self, key: tuple, limit: int) -> list:
+        return [json.loads(raw) for raw in await self.redis.lrange(self._name(key), -limit, -1)]
+
+    async def append(self, key: tuple, messages: tuple) -> None:
+        name = self._name(key)
+        # Append and trim in one round trip, keeping the newest messages
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.rpush(name, *(json.dumps(msg) for msg in messages))
+            pipe.ltrim(name, -MAX_HISTORY_MESSAGES, -1)
+            await pipe.execute()
+
+    async def close(self) -> None:
+        if self.redis is not None:
+            await self.redis.aclose()
+
+# Conversation log backend: Redis when REDIS_URL is set, else SQLite
+store = RedisStore(REDIS_URL) if REDIS_URL else SQLiteStore(HISTORY_DB)
+
+# In-memory cache of recent conversations, keyed by (user ID, channel ID);
+# the full log lives in the store and is loaded on first use. Idle and
+# least recently used conversations are evicted to bound memory.
+conversation_history = TTLCache(maxsize=HISTORY_CACHE_SIZE, ttl=HISTORY_IDLE_SECONDS)
+
+# Per-conversation locks so back-to-back messages are answered in order;
+# weak values drop a lock once no handler holds or waits on it
+_locks = weakref.WeakValueDictionary()
+
+# Background tasks (history writes), referenced until done so they are
+# not garbage collected mid-flight
+_bg_tasks = set()
+
+# LRU cache of Grok responses: conversation digest -> (timestamp, text)
+_cache = OrderedDict()
+
+# Attachment kinds by lowercase file extension
+_ATTACHMENT_KINDS = {".pdf": "pdf", ".jpg": "img", ".jpeg": "img", ".png": "img"}
+
+# Simple question starters and common short phrases
+_SIMPLE_KEYWORDS = (
+    'what is', 'who is', 'when is', 'where is', 'how many', 'define',
+    'explain', 'tell me about', 'what are', 'can you tell me', 'is it',
+    'what\'s', 'who\'s', 'why is', 'how does', 'what\'s the'
+)
+# One anchored pattern routes a message: the 'img' group matches
+# 'generate/create/draw' + 'image/picture/art', the 'simple' group matches
+# a leading simple-question keyword. The lazy '.*?' scans forward to the
+# first noun instead of running to the end of the line and backtracking.
+_ROUTE = re.compile(
+    r'\s*(?:(?P<img>(?:generate|create|draw)\s+.*?\b(?:image|picture|art)\b)'
+    r'|(?P<simple>(?:' + '|'.join(map(re.escape, _SIMPLE_KEYWORDS)) + r')\b))',
+    re.IGNORECASE
+)
+# Matches only messages with at least SIMPLE_WORD_THRESHOLD words, stopping
+# at the last one needed; '\S+\s+' cannot split a word, so it never backtracks
+# into miscounting
+_MANY_WORDS = re.compile(r'\s*(?:\S+\s+){%d}\S' % (SIMPLE_WORD_THRESHOLD - 1))
+
+# Utility function: Classify messages
+def classify_message(content: str) -> Literal["img", "simple", "complex"]:
+    """Classify a message as an image generation request, a simple question, or a complex one."""
+    m = _ROUTE.match(content)
+    if m is not None:
+        return m.lastgroup
+    # Consider very short messages (< SIMPLE_WORD_THRESHOLD words) as simple,
+    # without copying or splitting the (possibly PDF-sized) text
+    if _MANY_WORDS.match(content) is None:
+        return "simple"
+    return "complex"
+
+# Utility function: Append to conversation history
+def push(h: HistoryEntry, *messages: dict) -> None:
+    """Append messages to history, dropping the oldest beyond MAX_HISTORY_TOKENS."""
+    # encode_ordinary treats special-token text (e.g. "<|endoftext|>") as plain
+    # text; this is only a length measurement
+    tokens = [len(ENC.encode_ordinary(msg["content"])) for msg in messages]  # Encode once, at insert time
+    h.messages.extend(messages)
+    h.tokens.extend(tokens)
+    h.total += sum(tokens)
+    # Evict from the left, always keeping the latest exchange (and so the
+    # most recent user turn)
+    while (h.total > MAX_HISTORY_TOKENS or len(h.messages) > MAX_HISTORY_MESSAGES) and len(h.messages) > 2:
+        h.messages.popleft()
+        h.total -= h.tokens.popleft()
+
+# Utility function: Get a conversation lock
+def get_lock(key: tuple) -> asyncio.Lock:
+    """Return the lock serializing history updates for key."""
+    lock = _locks.get(key)
+    if lock is None:
+        lock = _locks[key] = asyncio.Lock()
+    return lock
+
+# Utility function: Run a coroutine in the background
+def run_in_background(coro) -> None:
+    """Schedule coro without awaiting it; failures are logged."""
+    task = asyncio.create_task(coro)
+    _bg_tasks.add(task)
+    task.add_done_callback(_background_done)
+
+def _background_done(task: asyncio.Task) -> None:
+    """Forget a finished background task and log its error, if any."""
+    _bg_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Background task error: {str(task.exception())}")
+
+# Async function: Get conversation history
+async def get_history(key: tuple) -> HistoryEntry:
+    """Return the cached history for key, loading recent turns from the store on a miss.
+
+    If the store is unavailable, answer without earlier turns rather than
+    not at all; the entry is not cached, so the next message retries the load.
+    """
+    h = conversation_history.get(key)
+    if h is None:
+        h = HistoryEntry()
+        try:
+            loaded = await store.load(key, HISTORY_LOAD_LIMIT)
+        except Exception as e:
+            logger.error(f"History load error: {str(e)}")
+            return h
+        push(h, *loaded)
+    # (Re)insert on every use so the idle timer restarts
+    conversation_history[key] = h
+    return h
+
+# Utility function: Build per-turn instructions
+def build_turn_instructions(is_simple: bool) -> tuple:
+    """Return the instruction messages to send after the prompt, and max tokens, based on question type."""
+    if is_simple:
+        # Brevity directive for simple questions, emphasizing extreme brevity
+        return (BRIEF_INSTRUCTION,), 70  # Reduced tokens to enforce brevity
+    # Default: the system prompt alone asks for detailed but concise answers
+    return (), MAX_RESPONSE_TOKENS
+
+# Utility function: Build a response cache key
+def response_cache_key(history: deque, prompt: dict, is_simple: bool) -> bytes:
+    """Digest the model, question type, history, and normalized prompt."""
+    # Key on the whole conversation so earlier turns can never leak a
+    # mismatched answer; only the new prompt's case/spacing is normalized
+    digest = hashlib.blake2b(f"{MODEL}|{is_simple}".encode(), digest_size=16)
+    for msg in history:
+        digest.update(f"\0{msg['role']}\0{msg['content']}".encode())
+    digest.update(b"\0" + " ".join(prompt["content"].lower().split()).encode())
+    return digest.digest()
+
+# Utility function: Look up a cached response
+def cached_response(key: bytes) -> Optional[str]:
+    """Return the cached response for key if still fresh, else None."""
+    cached = _cache.get(key)
+    if cached and time.monotonic() - cached[0] < RESPONSE_CACHE_TTL:
+        _cache.move_to_end(key)  # Mark as most recently used
+        return cached[1]
+    return None
+
+# Async generator: Stream Grok API text responses
+async def query_grok(history: deque, prompt: dict, is_simple: bool, key: bytes) -> AsyncGenerator[str, None]:
+    """Send history plus the new prompt to Grok API and yield the response text as it streams in."""
+    cached = cached_response(key)
+    if cached is not None:
+        yield cached
+        return
+
+    parts = []
+    try:
+        instructions, max_tokens = build_turn_instructions(is_simple)
+        # Make async streaming API call to Grok
+        stream = await client.chat.completions.create(
+            model=MODEL,
+            messages=[SYSTEM_PROMPT, *history, prompt, *instructions],  # Built once, at the API boundary
+            temperature=0.7,  # Moderate creativity
+            max_tokens=max_tokens,
+            stream=True
+        )
+        # Closing the stream (also when the consumer stops early) ends the
+        # request so no further tokens are generated or billed
+        async with stream:
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    yield delta
+    except OpenAIError as e:
+        logger.error(f"Grok API error: {str(e)}")
+        raise
+
+    text = "".join(parts).strip()
+    if not text:
+        return  # Never cache an empty answer; the next ask should retry
+    _cache[key] = (time.monotonic(), text)
+    _cache.move_to_end(key)
+    # Drop the least recently used entries beyond the size cap
+    while len(_cache) > RESPONSE_CACHE_SIZE:
+        _cache.popitem(last=False)
+
+# Async function: Reply with streamed text
+async def reply_streamed(message, chunks: AsyncGenerator[str, None]) -> str:
+    """Reply with the first chunk, edit it in place as more arrive, and return the posted text
+    (empty if Grok returned nothing, in which case a fallback reply is sent)."""
+    placeholder = None  # Sent with the first text, so nothing empty is posted
+    parts = []
+    length = last_len = 0
+    last_edit = time.monotonic()
+    edit = None  # In-flight edit, so streaming never waits on Discord
+    try:
+        async for delta in chunks:
+            parts.append(delta)
+            length += len(delta)
+            if length >= DISCORD_MAX_CHARS:
+                break  # Nothing more fits in the reply; stop generating
+            if placeholder is None:
+                if delta.strip():
+                    placeholder = await message.reply("".join(parts))
+                    last_edit = time.monotonic()
+                    last_len = length
+            # Throttle edits to stay well inside Discord's rate limits
+            elif ((edit is None or edit.done())
+                    and time.monotonic() - last_edit > STREAM_EDIT_INTERVAL
+                    and length - last_len >= STREAM_EDIT_MIN_CHARS):
+                # A failed interim edit is only logged; later edits retry it
+                if edit is not None and edit.exception() is not None:
+                    logger.error(f"Stream edit error: {str(edit.exception())}")
+                edit = asyncio.create_task(placeholder.edit(content="".join(parts)))
+                last_edit = time.monotonic()
+                last_len = length
+    finally:
+        await chunks.aclose()
+        # Let the last partial edit land before the final one; if it
+        # failed, the final edit below still posts the whole answer
+        if edit is not None:
+            with contextlib.suppress(discord.HTTPException):
+                await edit
+    # Cap at the Discord limit so the returned text is exactly what was posted
+    text = "".join(parts).strip()[:DISCORD_MAX_CHARS]
+    # Final reply or edit with the complete response
+    if not text:
+        # Discord rejects empty messages; nothing was posted yet either
+        await message.reply(EMPTY_RESPONSE_REPLY)
+    elif placeholder is None:
+        await message.reply(text)
+    else:
+        await placeholder.edit(content=text)
+    return text
+
+# Discord event: Handle bot startup
+@bot.event
+async def on_ready():
+    """Run when bot connects to Discord."""
+    global BOT_MENTION, BOT_MENTION_NICK
+    # Cache mention prefixes so on_message does not rebuild them
+    BOT_MENTION = f"<@{bot.user.id}>"
+    BOT_MENTION_NICK = f"<@!{bot.user.id}>"
+    # Log successful login
+    logger.error(f"✅ Logged in as {bot.user} (ID: {bot.user.id})")
+    # Set custom activity status
+    await bot.change_presence(activity=discord.CustomActivity(name="Change Me"))
+
+# Discord event: Handle incoming messages
+@bot.event
+async def on_message(message):
+    """Process messages, respond to mentions, replies, or PDF attachments."""
+    global PDF_POOL
+    if message.author == bot.user:
+        return  # Ignore bot's own messages
+    if not (message.mentions or message.reference):
+        return  # Cheapest filter first: neither a mention nor a reply
+    received = time.monotonic()  # Arrival time, before any lock wait
+
+    content = message.content.strip()
+    should_process = False
+
+    # Check for bot mention
+    if BOT_MENTION is not None and content.startswith((BOT_MENTION, BOT_MENTION_NICK)):
+        # Slice off the known prefix; the nickname form has '!' at index 2
+        prefix = BOT_MENTION_NICK if content[2] == "!" else BOT_MENTION
+        content = content[len(prefix):].strip()
+        should_process = True
+    # Check for reply to bot
+    elif message.reference and message.reference.resolved and message.reference.resolved.author == bot.user:
+        should_process = True
+
+    # Handle file attachments only if bot is mentioned or replied to
+    if should_process:
+        for attachment in message.attachments:
+            kind = _ATTACHMENT_KINDS.get(os.path.splitext(attachment.filename)[1].lower())
+            if kind == "pdf":
+                pool = PDF_POOL
+                try:
+                    # Read PDF bytes
+                    file_bytes = await attachment.read()
+                    # Parse off the event loop so other messages keep flowing
+                    loop = asyncio.get_running_loop()
+                    content = await loop.run_in_executor(
+                        pool, extract_text_from_pdf, file_bytes, PDF_MAX_PAGES, PDF_MAX_CHARS
+                    )
+                    break  # Process PDF and proceed to response
+                except BrokenProcessPool as e:
+                    # A worker died (e.g. the parser crashed on this PDF), which
+                    # breaks the whole pool; start a fresh one unless another
+                    # handler already has
+                    if PDF_POOL is pool:
+                        PDF_POOL = new_pdf_pool()
+                        pool.shutdown(wait=False)
+                    logger.error(f"PDF error: {str(e)}")
+                    await message.reply(f"[PDF Error] {str(e)}")
+                    return
+                except Exception as e:
+                    logger.error(f"PDF error: {str(e)}")
+                    await message.reply(f"[PDF Error] {str(e)}")
+                    return
+            elif kind == "img":
+                # Respond only for direct image uploads
+                await message.reply("Image handling is not supported.")
+                return  # Stop further processing
+
+    # Process valid text or PDF-based messages
+    if should_process and content:
+        # Create unique key for conversation history
+        history_key = (message.author.id, message.channel.id)
+        # Hold the conversation lock so a quick follow-up waits for this
+        # exchange instead of racing it with a stale history snapshot
+        async with get_lock(history_key):
+            history = await get_history(history_key)
+            # Skip an identical prompt re-sent moments after the last one
+            # (e.g. a double tap on mobile); it has just been answered. Only
+            # answered prompts are recorded, so a retry after an error is not
+            if content == history.last_prompt and received - history.last_prompt_at < DUPLICATE_WINDOW:
+                return
+
+            route = classify_message(content)
+            if route == "img":
+                # Reply that image generation is not supported
+                await message.reply("Image generation is not supported.")
+                # Update conversation history
+                exchange = (
+                    {"role": "user", "content": content},
+                    {"role": "assistant", "content": "Image generation is not supported."}
+                )
+                push(history, *exchange)
+                history.last_prompt, history.last_prompt_at = content, received
+                run_in_background(store.append(history_key, exchange))
+            else:
+                user_msg = {"role": "user", "content": content}
+                is_simple = route == "simple"
+                key = response_cache_key(history.messages, user_msg, is_simple)
+                # Only show typing while waiting on a slow answer; cache hits
+                # and brief answers reply fast enough without the extra call
+                if is_simple or cached_response(key) is not None:
+                    # An empty exit stack is a no-op async context on 3.9
+                    # (nullcontext only supports async with from 3.10)
+                    typing = contextlib.AsyncExitStack()
+                else:
+                    typing = message.channel.typing()
+
+                try:
+                    async with typing:
+                        # Stream Grok's response into a reply as it is generated
+                        response = await reply_streamed(
+                            message, query_grok(history.messages, user_msg, is_simple, key)
+                        )
+                    # Add the whole exchange to history in one step (evicts old
+                    # messages if too long); an empty answer is not recorded
+                    if response:
+                        exchange = (user_msg, {"role": "assistant", "content": response})
+                        push(history, *exchange)
+                        history.last_prompt, history.last_prompt_at = content, received
+                        # Persist the exchange in the background; the in-memory
+                        # history already has it
+                        run_in_background(store.append(history_key, exchange))
+                except OpenAIError as e:
+                    await message.reply(f"[Grok Error] {str(e)}")
+                except Exception as e:
+                    logger.error(f"Error: {str(e)}")
+                    await message.reply(f"[Error] {str(e)}")
+
+# Async function: Run the bot until shutdown
+async def main() -> None:
+    """Open the history store, start the bot, then close the store, API client, and PDF workers on shutdown."""
+    await store.open()
+    try:
+        async with bot:
+            await bot.start(DISCORD_TOKEN)
+    finally:
+        # Let pending history writes finish before closing the store
+        if _bg_tasks:
+            await asyncio.gather(*_bg_tasks, return_exceptions=True)
+        await store.close()
+        await client.close()
+        PDF_POOL.shutdown(cancel_futures=True)
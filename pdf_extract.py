@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# PDF text extraction, run in the bot's worker processes. Kept free of
+# import-time side effects so spawned workers start without loading the bot.
+from itertools import islice  # For capping PDF pages read
+try:
+    import fitz                # PyMuPDF, fast C-based PDF text extraction
+except ImportError:
+    fitz = None
+    from pypdf import PdfReader    # Pure-Python fallback for PDF text extraction
+    from io import BytesIO         # For handling PDF file bytes
+
+# Utility function: Iterate PDF page texts lazily
+def iter_pdf_pages(file_bytes: bytes):
+    """Yield the text of each PDF page, parsing pages only as they are consumed."""
+    if fitz is not None:
+        with fitz.open(stream=file_bytes, filetype="pdf") as doc:
+            for page in doc:
+                yield page.get_text("text")
+    else:
+        for page in PdfReader(BytesIO(file_bytes)).pages:
+            yield page.extract_text()
+
+# Utility function: Extract text from PDF
+def extract_text_from_pdf(file_bytes: bytes, max_pages: int, max_chars: int) -> str:
+    """Extract text from up to max_pages PDF pages, limit to max_chars."""
+    parts = []
+    total = 0
+    try:
+        # Stop as soon as max_chars are collected so no further page is parsed
+        for extracted in islice(iter_pdf_pages(file_bytes), max_pages):
+            if extracted:
+                parts.append(extracted)
+                total += len(extracted)
+                if total >= max_chars:
+                    break
+    except Exception as e:
+        # Parser errors (e.g. PyMuPDF's) may not pickle back to the bot
+        # process; pass on just the message
+        raise ValueError(str(e)) from None
+    text = "".join(parts)
+    if not text:
+        raise ValueError("No text extracted from PDF")
+    return text[:max_chars]  # Cap at max_chars